@@ -1,29 +1,43 @@
 import asyncio as aio
-import json
 import logging
 import os
 import signal
+import typing as ty
 from uuid import getnode as get_mac
 
+from . import jsonlib
 from .__version__ import version
 from .lumimqtt import LumiMqtt
 from .platform import devices
 
 logger = logging.getLogger(__name__)
 
+_mac: ty.Optional[str] = None
+
 
 def read_mac():
+    global _mac
+    if _mac is None:
+        _mac = _read_mac()
+    return _mac
+
+
+def _read_mac():
     # We try to read mac address from first interface at first
     # if the file is absent or empty, use generic uuid.getnode()
-    ifaces = [x for x in sorted(os.listdir('/sys/class/net/')) if x != 'lo']
-    if ifaces:
-        addr_file = f'/sys/class/net/{ifaces[0]}/address'
+    with os.scandir('/sys/class/net/') as it:
+        iface = min((x.name for x in it if x.name != 'lo'), default=None)
+    if iface:
+        addr_file = f'/sys/class/net/{iface}/address'
         try:
-            with open(addr_file, 'r') as f:
-                mac = f.readline().strip('\n')
+            fd = os.open(addr_file, os.O_RDONLY)
         except FileNotFoundError:
             pass
         else:
+            try:
+                mac = os.read(fd, 32).decode().strip()
+            finally:
+                os.close(fd)
             return f"0x{mac.replace(':', '')}"
 
     mac = get_mac()
@@ -34,6 +48,15 @@ def read_mac():
     return mac
 
 
+def load_config(path: str) -> dict:
+    # a missing config file means defaults only
+    try:
+        with open(path, 'rb') as f:
+            return jsonlib.loads(f.read())
+    except FileNotFoundError:
+        return {}
+
+
 def signal_handler():
     raise KeyboardInterrupt()
 
@@ -41,14 +64,13 @@ def signal_handler():
 async def amain():
     logging.basicConfig(level='INFO')
 
+    if hasattr(aio, 'eager_task_factory'):  # python 3.12+
+        # most publish and handler tasks finish without suspending,
+        # run them right away instead of scheduling a loop iteration
+        aio.get_running_loop().set_task_factory(aio.eager_task_factory)
+
     os.environ.setdefault('LUMIMQTT_CONFIG', '/etc/lumimqtt.json')
-    config = {}
-    if os.path.exists(os.environ['LUMIMQTT_CONFIG']):
-        try:
-            with open(os.environ['LUMIMQTT_CONFIG'], 'r') as f:
-                config = json.load(f)
-        except FileNotFoundError:
-            pass
+    config = load_config(os.environ['LUMIMQTT_CONFIG'])
 
     device_id = read_mac()
     config = {
@@ -59,6 +81,7 @@ async def amain():
         'auto_discovery': True,  # create homeassistant discovery topics
         'sensor_threshold': 50,  # 5% of illuminance sensor
         'sensor_debounce_period': 60,  # 1 minute
+        'sensor_min_interval': 0,  # seconds
         'light_transition_period': 1.0,  # second
         'light_notification_period': 60,  # 1 minute
         **config,
@@ -83,6 +106,7 @@ async def amain():
         sensor_retain=config.get('sensor_retain', False),
         sensor_threshold=int(config['sensor_threshold']),
         sensor_debounce_period=int(config['sensor_debounce_period']),
+        sensor_min_interval=float(config['sensor_min_interval']),
         light_transition_period=float(config['light_transition_period']),
         light_notification_period=float(config['light_notification_period']),
     )
@@ -105,6 +129,13 @@ async def amain():
 
 
 def main():
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        aio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
     try:
         aio.run(amain())
     except KeyboardInterrupt:
@@ -3,9 +3,12 @@ LUMI button input
 """
 
 import asyncio as aio
+import collections
+import typing as ty
 
-from evdev import InputDevice, KeyEvent, categorize, ecodes
+from evdev import InputDevice, KeyEvent, ecodes
 
+from . import jsonlib
 from .device import Device
 
 
@@ -31,49 +34,117 @@ class Button(Device):
         'icon': 'mdi:gesture-double-tap',
     }
     THRESHOLD = 0.3
+    # contact bounce: a key state counts once no other edge follows it
+    # within DEBOUNCE seconds, like QMK's sym_defer_g
+    DEBOUNCE = 0.01
+    # key_hold (autorepeat) is ignored, the state machine times holds itself
+    KEY_STATES = frozenset((KeyEvent.key_up, KeyEvent.key_down))
     PROVIDE_EVENTS = [
         getattr(ButtonAction, x)
         for x in dir(ButtonAction) if not x.startswith('__')
     ]
+    # (is_pressed, clicks_done) -> action
+    ACTIONS = {
+        (False, 1): ButtonAction.SINGLE,
+        (False, 2): ButtonAction.DOUBLE,
+        (False, 3): ButtonAction.TRIPLE,
+        (False, 4): ButtonAction.QUADRUPLE,
+        (True, 0): ButtonAction.HOLD,
+        (True, 1): ButtonAction.DOUBLE_HOLD,
+        (True, 2): ButtonAction.TRIPLE_HOLD,
+        (True, 3): ButtonAction.QUADRUPLE_HOLD,
+    }
+    # state payloads are sent on every click, encode them once
+    ACTION_PAYLOADS = {
+        event: jsonlib.dumps({'action': event})
+        for event in [*PROVIDE_EVENTS, '']
+    }
 
     def __init__(self, name, device_file, topic, scancodes):
         super().__init__(name, device_file, topic)
         self.ev_device = InputDevice(self.device_file)
-        self.scancodes = [ecodes.ecodes[scancode] for scancode in scancodes]
+        self.scancodes = frozenset(
+            ecodes.ecodes[scancode] for scancode in scancodes
+        )
+
+        self.full_action_topic: ty.Optional[str] = None
+
+        # pending key states, the reader callback appends and sets the flag;
+        # unbounded, dropping the oldest edge could lose a key_down and keep
+        # its key_up; key presses come at human speed and each wakeup of
+        # the consumer drains them
+        self.events: ty.Deque[int] = collections.deque()
+        self.events_ready = aio.Event()
+        self.stable_event = KeyEvent.key_up
+        self.candidate_event: ty.Optional[int] = None
+        self.is_pressed = False
+        self.is_sent = False
+        self.clicks_done = 0
 
-        self.event_queue = None
+    def reset(self):
+        """
+        Forget pending edges and the click state
+        """
+        self.events.clear()
+        self.events_ready.clear()
+        self.stable_event = KeyEvent.key_up
+        self.candidate_event = None
         self.is_pressed = False
         self.is_sent = False
         self.clicks_done = 0
 
+    @property
+    def action_topic(self):
+        return f'{self.topic}/action'
+
+    def close(self):
+        self.ev_device.close()
+
     async def handle_events(self):
-        async for event in self.ev_device.async_read_loop():
-            event = categorize(event)
-            if isinstance(event, KeyEvent) and (
-                not self.scancodes or event.scancode in self.scancodes
-            ):
-                if event.keystate in [KeyEvent.key_up, KeyEvent.key_down]:
-                    await self.event_queue.put(event.keystate)
+        loop = aio.get_running_loop()
+        failed = loop.create_future()
+
+        ev_key = ecodes.EV_KEY
+        scancodes = self.scancodes
+        key_states = self.KEY_STATES
+
+        def on_readable():
+            # match raw input events, categorize() would build a KeyEvent each
+            try:
+                for event in self.ev_device.read():
+                    if event.type != ev_key or (
+                        scancodes and event.code not in scancodes
+                    ):
+                        continue
+                    if event.value in key_states:
+                        self.events.append(event.value)
+                        self.events_ready.set()
+            except BlockingIOError:
+                pass
+            except OSError as e:
+                if not failed.done():
+                    failed.set_exception(e)
+
+        # read the device straight from the loop's selector
+        loop.add_reader(self.ev_device.fd, on_readable)
+        try:
+            await failed
+        finally:
+            loop.remove_reader(self.ev_device.fd)
 
     async def handle_queue(self, on_click):
+        key_up, key_down = KeyEvent.key_up, KeyEvent.key_down
         while True:
             if self.is_pressed and not self.is_sent or self.clicks_done:
                 try:
                     event = await aio.wait_for(
-                        self.event_queue.get(),
+                        self.next_event(),
                         timeout=self.THRESHOLD,
                     )
                 except aio.TimeoutError:
-                    action = {
-                        (False, 1): ButtonAction.SINGLE,
-                        (False, 2): ButtonAction.DOUBLE,
-                        (False, 3): ButtonAction.TRIPLE,
-                        (False, 4): ButtonAction.QUADRUPLE,
-                        (True, 0): ButtonAction.HOLD,
-                        (True, 1): ButtonAction.DOUBLE_HOLD,
-                        (True, 2): ButtonAction.TRIPLE_HOLD,
-                        (True, 3): ButtonAction.QUADRUPLE_HOLD,
-                    }.get((self.is_pressed, self.clicks_done))
+                    action = self.ACTIONS.get(
+                        (self.is_pressed, self.clicks_done),
+                    )
                     if action is None:
                         if self.clicks_done > 3 and self.is_pressed:
                             action = ButtonAction.MANY_HOLD
@@ -86,23 +157,63 @@ class Button(Device):
                     self.is_sent = self.is_pressed
                     self.clicks_done = 0
                 else:
-                    if event == KeyEvent.key_up:
+                    if event == key_up:
                         self.clicks_done += 1
                         self.is_pressed = False
-                    elif event == KeyEvent.key_down:
+                    elif event == key_down:
                         self.is_pressed = True
             else:
-                event = await self.event_queue.get()
-                if event == KeyEvent.key_up:
+                event = await self.next_event()
+                if event == key_up:
                     self.is_pressed = False
                     await on_click(self, ButtonAction.RELEASE)
-                elif event == KeyEvent.key_down:
+                elif event == key_down:
                     self.is_pressed = True
                 self.is_sent = False
 
+    async def next_event(self) -> int:
+        # the candidate is kept on the instance, so a timeout cancelling
+        # this call in handle_queue doesn't lose an edge already read
+        while True:
+            if self.candidate_event is None:
+                self.candidate_event = await self.next_raw_event()
+            try:
+                event = await aio.wait_for(
+                    self.next_raw_event(),
+                    timeout=self.DEBOUNCE,
+                )
+            except aio.TimeoutError:
+                event, self.candidate_event = self.candidate_event, None
+                # bounced back to the stable state means nothing happened
+                if event != self.stable_event:
+                    self.stable_event = event
+                    return event
+            else:
+                self.candidate_event = event
+
+    async def next_raw_event(self) -> int:
+        while not self.events:
+            self.events_ready.clear()
+            await self.events_ready.wait()
+        return self.events.popleft()
+
     async def handle(self, on_click):
-        self.event_queue = aio.Queue()
-        await aio.gather(
-            self.handle_events(),
-            self.handle_queue(on_click),
-        )
+        # a restarted handler must not replay edges or clicks of the old one
+        self.reset()
+        tasks = [
+            aio.create_task(self.handle_events()),
+            aio.create_task(self.handle_queue(on_click)),
+        ]
+        try:
+            finished, _ = await aio.wait(
+                tasks,
+                return_when=aio.FIRST_COMPLETED,
+            )
+        finally:
+            # don't leave a reader or a consumer behind on restart, wait
+            # for them so the reader is removed before this returns
+            for t in tasks:
+                t.cancel()
+            await aio.gather(*tasks, return_exceptions=True)
+        for t in finished:
+            t.result()
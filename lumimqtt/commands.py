@@ -4,8 +4,11 @@ LUMI light control
 import asyncio as aio
 import contextlib
 import logging
-import subprocess
+import shlex
+import string
 import sys
+import typing as ty
+import uuid
 from collections import defaultdict
 
 from .device import Device
@@ -13,53 +16,144 @@ from .device import Device
 logger = logging.getLogger(__name__)
 
 
+if sys.version_info < (3, 8, 0):
+    @contextlib.contextmanager
+    def fix_watcher():
+        # https://github.com/aio-libs/aiohttp/pull/2075/files#diff-70599d14cae2351e35e46867bce26e325e84f3b84ce218718239c4bfeac4dcf5R445-R448
+        loop = aio.get_running_loop()
+        policy = aio.get_event_loop_policy()
+        watcher = policy.get_child_watcher()
+        watcher.attach_loop(loop)
+        yield
+else:
+    fix_watcher = contextlib.nullcontext
+
+
+class ShellWorker:
+    """
+    Long-lived shell that runs commands without starting a new one each time
+    """
+
+    def __init__(self):
+        self.proc: ty.Optional[aio.subprocess.Process] = None
+        self.lock = aio.Lock()
+        self.sentinel = f'__lumimqtt_done_{uuid.uuid4().hex}__'.encode()
+
+    async def run(self, command: str):
+        async with self.lock:
+            try:
+                await self._run(command)
+            except BaseException:
+                # the shell is in an unknown state, start a new one next time
+                await self.close()
+                raise
+
+    async def _run(self, command: str):
+        if self.proc is None:
+            with fix_watcher():
+                self.proc = await aio.create_subprocess_exec(
+                    'sh',
+                    stdin=aio.subprocess.PIPE,
+                    stdout=aio.subprocess.PIPE,
+                    stderr=aio.subprocess.DEVNULL,
+                )
+        # the command is a single quoted argument of eval, so unbalanced
+        # quotes in it can't swallow the sentinel line; the subshell is a
+        # fork without an exec and keeps `cd`, variables and `exit` away
+        # from the worker, detached stdin/stdout keep the command away from
+        # the protocol
+        self.proc.stdin.write(
+            f'( eval {shlex.quote(command)} ) </dev/null >/dev/null 2>&1; '
+            f'echo {self.sentinel.decode()}\n'.encode(),
+        )
+        await self.proc.stdin.drain()
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                raise ConnectionError('Command worker shell exited')
+            if line.rstrip() == self.sentinel:
+                return
+
+    async def close(self):
+        proc, self.proc = self.proc, None
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
 class Command(Device):
     """
     Custom command control
     """
+    QUOTE_TABLE = str.maketrans({'"': '\\"', "'": "\\'", '$': None})
 
-    def __init__(self, name, device_file, topic):
+    def __init__(self, name, device_file, topic, persistent=False):
         super().__init__(name, device_file, topic)
         self.command = device_file
+        # opt-in: run in a subshell of this command's long-lived shell
+        # instead of starting a new shell
+        self.worker = ShellWorker() if persistent else None
+        self.template = self.parse_template(device_file)
 
     @property
     def topic_set(self):
         return f'{self.topic}/set'
 
-    @contextlib.contextmanager
-    def fix_watcher(self):
-        if sys.version_info < (3, 8, 0):
-            # https://github.com/aio-libs/aiohttp/pull/2075/files#diff-70599d14cae2351e35e46867bce26e325e84f3b84ce218718239c4bfeac4dcf5R445-R448
-            loop = aio.get_event_loop()
-            policy = aio.get_event_loop_policy()
-            watcher = policy.get_child_watcher()
-            watcher.attach_loop(loop)
-        yield
-
-    @staticmethod
-    def quote(s):
+    @classmethod
+    def quote(cls, s):
         try:
-            return str(s).replace('"', '\\"').replace("'", "\\'"). \
-                replace('$', '')
-        except Exception:
+            return str(s).translate(cls.QUOTE_TABLE)
+        except (TypeError, ValueError):
             logger.exception('Error on escaping command')
             return ""
 
+    @staticmethod
+    def parse_template(command):
+        """
+        Split the command into (literal, field) pairs once. Returns None
+        if it uses conversions, format specs or non-plain field names,
+        then str.format_map() is used every time instead.
+        """
+        try:
+            parsed = list(string.Formatter().parse(command))
+        except ValueError:
+            return None
+        for _, field, spec, conversion in parsed:
+            if spec or conversion or (
+                field is not None and not field.isidentifier()
+            ):
+                return None
+        return [(literal, field) for literal, field, _, _ in parsed]
+
+    def format_command(self, values: dict) -> str:
+        if self.template is None:
+            return self.command.format_map(defaultdict(str, **values))
+        parts = []
+        for literal, field in self.template:
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(values.get(field, '')))
+        return ''.join(parts)
+
     async def run_command(self, value):
         if isinstance(value, dict):
             value = {
                 k: self.quote(v)
                 for k, v in value.items()
             }
-            command = self.command.format_map(defaultdict(str, **value))
+            command = self.format_command(value)
         else:
-            command = self.command.format_map(defaultdict(str, text=value))
+            command = self.format_command({'text': value})
+
+        if self.worker is not None:
+            await self.worker.run(command)
+            return
 
-        with self.fix_watcher():
+        with fix_watcher():
             proc = await aio.create_subprocess_shell(
                 command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stdout=aio.subprocess.PIPE,
+                stderr=aio.subprocess.PIPE,
             )
         await proc.wait()
 
@@ -1,8 +1,24 @@
 """
 Basic Device class
 """
+import asyncio as aio
 import os
 import typing as ty
+from concurrent.futures import ThreadPoolExecutor
+
+# sysfs access may block (the IIO driver samples the ADC on read), run it
+# in dedicated threads to keep the event loop responsive. Three workers let
+# the red, green and blue channels of a light be written at the same time.
+IO_WORKERS = 3
+io_executor = ThreadPoolExecutor(
+    max_workers=IO_WORKERS,
+    thread_name_prefix='sysfs',
+)
+
+
+async def run_io(func, *args):
+    loop = aio.get_running_loop()
+    return await loop.run_in_executor(io_executor, func, *args)
 
 
 class Device:
@@ -12,6 +28,8 @@ class Device:
         self.name = name
         self.device_file = device_file
         self.topic = topic or name
+        # absolute topic, set once the device is registered
+        self.full_topic: ty.Optional[str] = None
 
     def read_raw(self, device_file=None):
         if not device_file:
@@ -20,3 +38,6 @@ class Device:
             with open(device_file, 'r') as f:
                 return f.read().strip()
         return None
+
+    def close(self):
+        pass
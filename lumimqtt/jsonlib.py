@@ -0,0 +1,20 @@
+"""
+JSON encoding for MQTT payloads and the config file,
+uses orjson when it is installed and falls back to the json module
+"""
+import typing as ty
+
+try:
+    import orjson
+except ImportError:
+    import json
+
+    def dumps(obj: ty.Any) -> bytes:
+        return json.dumps(obj).encode()
+
+    loads = json.loads
+else:
+    dumps = orjson.dumps
+    loads = orjson.loads
+
+__all__ = ['dumps', 'loads']
@@ -2,15 +2,34 @@
 LUMI light control
 """
 import asyncio as aio
+import functools
 import logging
 import os
 import typing as ty
+from array import array
 
-from .device import Device
+from . import jsonlib
+from .device import Device, run_io
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def pwm_table(max_brightness: int) -> array:
+    """
+    LED values for every (color, brightness) pair,
+    indexed by `color << 8 | brightness`
+    """
+    return array('H' if max_brightness < 1 << 16 else 'L', (
+        int(min(max(c / 255 * max_brightness * b / 255, 0), max_brightness))
+        for c in range(256) for b in range(256)
+    ))
+
+
+def channel(value) -> int:
+    return min(max(int(value), 0), 255)
+
+
 class LED(Device):
     """
     LED control
@@ -21,10 +40,20 @@ class LED(Device):
         self.brightness = int(self.read_raw(self.device_file))
         max_brightness_dev = os.path.join(device_dir, 'max_brightness')
         self.max_brightness = int(self.read_raw(max_brightness_dev))
+        self.pwm_table = pwm_table(self.max_brightness)
+        self._fd: ty.Optional[int] = os.open(self.device_file, os.O_WRONLY)
+        self._last_value: ty.Optional[int] = None
 
     async def write(self, value: int):
-        with open(self.device_file, 'w') as f:
-            f.write(f'{value}\n')
+        if value == self._last_value:
+            return
+        await run_io(os.pwrite, self._fd, b'%d\n' % value, 0)
+        self._last_value = value
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
 
 
 class Light(Device):
@@ -57,17 +86,31 @@ class Light(Device):
         for c, led in self.leds.items():
             self.state['color'][c] = int(
                 led.brightness / led.max_brightness * 255)
+        self.state_json = jsonlib.dumps(self.state)
 
     @property
     def topic_set(self):
         return f'{self.topic}/set'
 
-    async def set(self, value: dict, transition_period: float):
+    def close(self):
+        for led in self.leds.values():
+            led.close()
+
+    async def set(self, value: dict, transition_period: float) -> bool:
+        """
+        Apply the requested state, return False if it is already applied
+        """
         state = value.get('state', self.state['state'])
         color = value.get('color', self.state['color'])
         # have to save to separate variable, to keep it after off
         target_brightness = \
             brightness = value.get('brightness', self.state['brightness'])
+        if (state, target_brightness, color) == (
+            self.state['state'],
+            self.state['brightness'],
+            self.state['color'],
+        ):
+            return False
         transition = value.get('transition', transition_period)  # seconds
         start_brightness = self.state['brightness']
         start_color = self.state['color']
@@ -77,11 +120,12 @@ class Light(Device):
             color = self.state['color']
             state = 'OFF'
 
+        is_off = state.lower() == 'off'
         if self.state['state'].lower() == 'off':
             start_brightness = 0
             if color['r'] == 0 and color['g'] == 0 and color['b'] == 0:
                 color['r'] = color['g'] = color['b'] = 255
-        if state.lower() == 'off':
+        if is_off:
             brightness = 0
 
         def color_repr(color: dict):
@@ -96,22 +140,41 @@ class Light(Device):
             if steps < 1:
                 steps = 1
             delay = transition / steps / 3
-            for step_num in range(1, steps):
-                for c, led in self.leds.items():
-                    step = (color[c] * brightness / 255 -
-                            start_color[c] * start_brightness / 255) / steps
-                    next_value = (start_color[c] * start_brightness / 255 +
-                                  step * step_num) / 255 * led.max_brightness
-                    next_value = int(min(max(next_value, 0),
-                                         led.max_brightness))  # normalize
-                    await led.write(next_value)
-                await aio.sleep(delay)
-
-        for c, led in self.leds.items():
-            next_value = color[c] / 255 * led.max_brightness * brightness / 255
-            next_value = int(min(max(next_value, 0),
-                                 led.max_brightness))  # normalize
-            await led.write(next_value)
+            # compute every intermediate value before the first write
+            ramps = []
+            for c, led in self.leds.items():
+                start = start_color[c] * start_brightness / 255
+                step = (color[c] * brightness / 255 - start) / steps
+                if not step:
+                    continue  # the channel stays as it is
+                ramps.append((led, [
+                    int(min(max(
+                        (start + step * step_num) / 255 * led.max_brightness,
+                        0,
+                    ), led.max_brightness))  # normalize
+                    for step_num in range(1, steps)
+                ]))
+            # anchor steps to the start, so write latency doesn't add up
+            loop = aio.get_running_loop()
+            started = loop.time()
+            for step_idx in range(steps - 1 if ramps else 0):
+                await aio.gather(*[
+                    led.write(ramp[step_idx]) for led, ramp in ramps
+                ])
+                deadline = started + (step_idx + 1) * delay
+                await aio.sleep(max(0.0, deadline - loop.time()))
+
+        # channels are separate files, write them in parallel
+        if is_off:
+            await aio.gather(*[led.write(0) for led in self.leds.values()])
+        else:
+            brightness_idx = channel(brightness)
+            await aio.gather(*[
+                led.write(
+                    led.pwm_table[channel(color[c]) << 8 | brightness_idx],
+                )
+                for c, led in self.leds.items()
+            ])
 
         self.state = {
             'state': state,
@@ -119,3 +182,5 @@ class Light(Device):
             'color': color,
             'color_mode': self.COLOR_MODE,
         }
+        self.state_json = jsonlib.dumps(self.state)
+        return True
@@ -3,20 +3,20 @@ LUMI MQTT handler
 """
 
 import asyncio as aio
-import json
 import logging
+import select
 import typing as ty
 from dataclasses import dataclass
-from datetime import datetime
 
 import aio_mqtt
 
+from . import jsonlib
 from .__version__ import version
 from .button import Button
 from .commands import Command
-from .device import Device
+from .device import Device, io_executor, run_io
 from .light import Light
-from .sensors import BinarySensor, Sensor
+from .sensors import Sensor
 
 logger = logging.getLogger(__name__)
 
@@ -26,8 +26,9 @@ RECONNECTION_LIMIT = 5
 
 @dataclass
 class DebounceSensor:
+    __slots__ = ('value', 'last_sent')
     value: ty.Any
-    last_sent: datetime
+    last_sent: float  # loop.time()
 
 
 class LumiMqtt:
@@ -48,6 +49,7 @@ class LumiMqtt:
             sensor_retain: bool,
             sensor_threshold: int,
             sensor_debounce_period: int,
+            sensor_min_interval: float = 0,
             light_transition_period: float,
             light_notification_period: float,
     ) -> None:
@@ -68,33 +70,72 @@ class LumiMqtt:
             qos=aio_mqtt.QOSLevel.QOS_1,
             retain=True,
         )
+        self._online_message = aio_mqtt.PublishableMessage(
+            topic_name=self._topic_lwt,
+            payload='online',
+            qos=aio_mqtt.QOSLevel.QOS_1,
+            retain=True,
+        )
 
         self._auto_discovery = auto_discovery
         self._sensor_retain = sensor_retain
         self._sensor_threshold = sensor_threshold
         self._sensor_debounce_period = sensor_debounce_period
+        self._sensor_min_interval = sensor_min_interval
         self._light_transition_period = light_transition_period
         self._light_notification_period = light_notification_period
-        self._light_last_sent = None
+        self._light_last_sent: ty.Dict[Light, float] = {}
+        # light -> command received while it was being set, the key is
+        # present as long as a handler runs for the light
+        self._light_pending: ty.Dict[Light, ty.Optional[dict]] = {}
         self._reconnection_interval = reconnection_interval
-        self._client = aio_mqtt.Client(
-            loop=aio.get_running_loop(),
-            client_id_prefix='lumimqtt_',
-        )
+        self._loop = aio.get_running_loop()
+        self._client = aio_mqtt.Client(client_id_prefix='lumimqtt_')
         self._tasks: ty.List[aio.Future] = []
+        self._connected = aio.Event()
+        self._background_tasks: ty.Set[aio.Task] = set()
+        self._message_tasks: ty.Set[aio.Task] = set()
 
         self.sensors: ty.List[Sensor] = []
         self.lights: ty.List[Light] = []
         self.buttons: ty.List[Button] = []
         self.custom_commands: ty.List[Command] = []
 
+        # set topic -> device, one lookup routes an incoming message
+        self._device_by_set_topic: ty.Dict[str, ty.Union[Light, Command]] = {}
+        # TODO: add SOUND/TTS topics ?
+        self.subscribed_topics: ty.FrozenSet[str] = frozenset()
+        # SUBSCRIBE arguments, rebuilt with the topics on register()
+        self._subscriptions: ty.List[ty.Tuple[str, aio_mqtt.QOSLevel]] = []
+
+        self._ha_device = {
+            'identifiers': [
+                f'xiaomi_gateway_{self.dev_id}',
+            ],
+            'name': f'xiaomi_gateway_{self.dev_id}',
+            'sw_version': version,
+            'model': 'Xiaomi Gateway',
+            'manufacturer': 'Xiaomi',
+        }
+        # discovery payloads are invariant, encode them once on register()
+        self._discovery_messages: ty.List[aio_mqtt.PublishableMessage] = []
+
         self._debounce_sensors: ty.Dict[Sensor, DebounceSensor] = {}
+        self._binary_messages: ty.Dict[
+            ty.Tuple[Sensor, str],
+            aio_mqtt.PublishableMessage,
+        ] = {}
+        self._button_reset_messages: ty.Dict[
+            Button,
+            aio_mqtt.PublishableMessage,
+        ] = {}
 
     async def start(self):
         self._tasks = [
             aio.create_task(self._connect_forever()),
             aio.create_task(self._handle_messages()),
             aio.create_task(self._periodic_publish()),
+            aio.create_task(self._watch_sensors()),
             aio.create_task(self._handle_buttons()),
         ]
         finished, _ = await aio.wait(
@@ -105,34 +146,79 @@ class LumiMqtt:
             t.result()
 
     async def close(self) -> None:
+        tasks = [*self._tasks, *self._background_tasks]
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+        if tasks:
+            # cancel concurrently, one slow task must not hold the others
+            try:
+                await aio.wait_for(
+                    aio.gather(*tasks, return_exceptions=True),
+                    timeout=2.0,
+                )
+            except aio.TimeoutError:
+                logger.warning("Tasks did not finish within 2 seconds")
         if self._client.is_connected():
             await self._client.disconnect()
+        # let the persistent command shells exit while the loop still runs
+        await aio.gather(*[
+            command.worker.close()
+            for command in self.custom_commands
+            if command.worker is not None
+        ])
+        # let a pending sysfs call finish before its descriptor is closed,
+        # without blocking the loop on a stuck one
+        try:
+            await aio.wait_for(
+                self._loop.run_in_executor(None, io_executor.shutdown),
+                timeout=2.0,
+            )
+        except aio.TimeoutError:
+            logger.warning("sysfs calls did not finish within 2 seconds")
+        for device in (
+            *self.sensors,
+            *self.lights,
+            *self.buttons,
+            *self.custom_commands,
+        ):
+            device.close()
 
     def register(self, device: Device):
         if not device:
             return
-        mapping: dict[type, list] = {
-            Sensor: self.sensors,
-            Button: self.buttons,
-            Light: self.lights,
-            Command: self.custom_commands,
-        }
-        for typ, array in mapping.items():
-            if isinstance(device, typ):
-                array.append(device)
-                break
+        device.full_topic = self._get_topic(device.topic)
+        if isinstance(device, Light):
+            self.lights.append(device)
+            topic = self._get_topic(device.topic_set)
+            self._device_by_set_topic[topic] = device
+        elif isinstance(device, Command):
+            self.custom_commands.append(device)
+            topic = self._get_topic(device.topic_set)
+            self._device_by_set_topic[topic] = device
+        elif isinstance(device, Button):
+            self.buttons.append(device)
+            device.full_action_topic = self._get_topic(device.action_topic)
+            self._button_reset_messages[device] = \
+                aio_mqtt.PublishableMessage(
+                    topic_name=device.full_topic,
+                    payload=device.ACTION_PAYLOADS[''],
+                    qos=aio_mqtt.QOSLevel.QOS_0,
+                )
+        elif isinstance(device, Sensor):
+            self.sensors.append(device)
         else:
             raise NotImplementedError()
 
+        self.subscribed_topics = frozenset(self._device_by_set_topic)
+        self._subscriptions = [
+            (t, aio_mqtt.QOSLevel.QOS_1) for t in self.subscribed_topics
+        ]
+        self._discovery_messages.extend(self._build_discovery(device))
+
     def _get_topic(self, subtopic):
         return f'{self._topic_root}/{subtopic}'
 
-    @property
-    def subscribed_topics(self):
-        # TODO: add SOUND/TTS topics ?
-        return [self._get_topic(light.topic_set) for light in self.lights] + \
-            [self._get_topic(cmd.topic_set) for cmd in self.custom_commands]
-
     async def _command_handler(self, command: Command, value):
         await command.set(value)
         reconnection_counter = 0
@@ -140,7 +226,7 @@ class LumiMqtt:
             try:
                 await self._client.publish(
                     aio_mqtt.PublishableMessage(
-                        topic_name=self._get_topic(command.topic),
+                        topic_name=command.full_topic,
                         payload='OFF',
                         qos=aio_mqtt.QOSLevel.QOS_1,
                     ),
@@ -153,8 +239,28 @@ class LumiMqtt:
                     raise
                 await self._client.wait_for_connect()
 
-    async def _light_handler(self, light: Light, value):
-        await light.set(value, self._light_transition_period)
+    def _set_light(self, light: Light, value: dict):
+        if light in self._light_pending:
+            # a slider drag floods commands, the running handler applies
+            # only the latest state once its current change is done
+            pending = self._light_pending[light]
+            self._light_pending[light] = {**(pending or {}), **value}
+            return
+        self._light_pending[light] = value
+        self._start_message_task(self._light_handler(light))
+
+    async def _light_handler(self, light: Light):
+        try:
+            value = self._light_pending[light]
+            while value is not None:
+                self._light_pending[light] = None
+                if await light.set(value, self._light_transition_period):
+                    await self._publish_light_state(light)
+                value = self._light_pending[light]
+        finally:
+            del self._light_pending[light]
+
+    async def _publish_light_state(self, light: Light):
         reconnection_counter = 0
         while True:
             try:
@@ -168,115 +274,105 @@ class LumiMqtt:
                 await self._client.wait_for_connect()
 
     async def _handle_messages(self) -> None:
-        running_message_tasks: list[aio.Task] = []
         try:
             async for message in self._client.delivered_messages(
                     f'{self._topic_root}/#',
             ):
-                for task in running_message_tasks:
-                    if task.done():
-                        try:
-                            task.result()
-                        except Exception:
-                            logger.exception(
-                                "Unhandled exception during echo "
-                                "message publishing",
-                            )
-                        finally:
-                            running_message_tasks.remove(task)
-                if message.topic_name not in self.subscribed_topics:
-                    logger.error("Invalid topic for light")
-                    continue
-                light: ty.Optional[Light] = None
-                for _light in self.lights:
-                    if message.topic_name == self._get_topic(_light.topic_set):
-                        light = _light
-                if light:
+                device = self._device_by_set_topic.get(message.topic_name)
+                if isinstance(device, Light):
+                    # light commands are JSON objects, reject anything else
+                    # without going through the parser and its exception
+                    if message.payload.lstrip()[:1] != b'{':
+                        logger.error(
+                            f'Invalid light payload: {message.payload!r}',
+                        )
+                        continue
                     try:
-                        value = json.loads(message.payload)
+                        value = jsonlib.loads(message.payload)
                     except ValueError as e:
                         logger.exception(str(e))
                         continue
-                    new_light_task = aio.create_task(self._light_handler(light, value))
-                    running_message_tasks.append(new_light_task)
-                    continue
-                command: ty.Optional[Command] = None
-                for _command in self.custom_commands:
-                    if message.topic_name == self._get_topic(
-                            _command.topic_set,
-                    ):
-                        command = _command
-                if command:
+                    self._set_light(device, value)
+                elif isinstance(device, Command):
                     try:
-                        value = json.loads(message.payload)
+                        value = jsonlib.loads(message.payload)
                     except ValueError:
                         value = message.payload.decode()
-                    new_command_task = aio.create_task(self._command_handler(command, value))
-                    running_message_tasks.append(new_command_task)
-        except aio.CancelledError:
-            for task in running_message_tasks:
-                if task.done():
-                    try:
-                        task.result()
-                    except Exception:
-                        pass
+                    self._start_message_task(
+                        self._command_handler(device, value),
+                    )
                 else:
-                    task.cancel()
-                    try:
-                        await task
-                    except (Exception, aio.CancelledError):
-                        pass
+                    logger.error("Invalid topic for light")
+        except aio.CancelledError:
+            for task in list(self._message_tasks):
+                task.cancel()
+                try:
+                    await task
+                except (Exception, aio.CancelledError):
+                    pass
+
+    def _start_message_task(self, coro):
+        # finished tasks are reaped by their callback, no scan per message
+        task = aio.create_task(coro)
+        self._message_tasks.add(task)
+        task.add_done_callback(self._message_task_done)
+
+    def _message_task_done(self, task: aio.Task):
+        self._message_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                "Unhandled exception during echo message publishing",
+                exc_info=task.exception(),
+            )
 
     async def send_config(self):
-        device = {
-            'identifiers': [
-                f'xiaomi_gateway_{self.dev_id}',
-            ],
-            'name': f'xiaomi_gateway_{self.dev_id}',
-            'sw_version': version,
-            'model': 'Xiaomi Gateway',
-            'manufacturer': 'Xiaomi',
+        await aio.gather(*[
+            self._client.publish(m) for m in self._discovery_messages
+        ])
+
+    def _get_generic_vals(self, name):
+        return {
+            'name': f'{name}_{self.dev_id}',
+            'unique_id': f'{name}_{self.dev_id}',
+            'device': self._ha_device,
+            'availability_topic': self._topic_lwt,
         }
 
-        def get_generic_vals(name):
-            return {
-                'name': f'{name}_{self.dev_id}',
-                'unique_id': f'{name}_{self.dev_id}',
-                'device': device,
-                'availability_topic': self._topic_lwt,
-            }
-
+    def _build_discovery(
+            self,
+            device: Device,
+    ) -> ty.List[aio_mqtt.PublishableMessage]:
         # set sensors config
-        for sensor in self.sensors:
-            await self._client.publish(
+        if isinstance(device, Sensor):
+            return [
                 aio_mqtt.PublishableMessage(
                     topic_name=(
                         f'homeassistant/'
-                        f"{'binary_' if self._is_binary(sensor) else ''}sensor"
-                        f'/{self.dev_id}/{sensor.topic}/config'
+                        f"{'binary_' if device.BINARY else ''}sensor"
+                        f'/{self.dev_id}/{device.topic}/config'
                     ),
-                    payload=json.dumps({
-                        **get_generic_vals(sensor.name),
-                        **(sensor.MQTT_VALUES or {}),
-                        'state_topic': self._get_topic(sensor.topic),
+                    payload=jsonlib.dumps({
+                        **self._get_generic_vals(device.name),
+                        **(device.MQTT_VALUES or {}),
+                        'state_topic': self._get_topic(device.topic),
                     }),
                     qos=aio_mqtt.QOSLevel.QOS_1,
                     retain=True,
                 ),
-            )
+            ]
 
         # set buttons config
-        for button in self.buttons:
-            base_topic = self._get_topic(button.topic)
+        if isinstance(device, Button):
+            base_topic = device.full_topic
             messages = [
                 aio_mqtt.PublishableMessage(
                     topic_name=(
                         f'homeassistant/sensor/{self.dev_id}/'
-                        f'{button.topic}/config'
+                        f'{device.topic}/config'
                     ),
-                    payload=json.dumps({
-                        **get_generic_vals(button.name),
-                        **(button.MQTT_VALUES or {}),
+                    payload=jsonlib.dumps({
+                        **self._get_generic_vals(device.name),
+                        **(device.MQTT_VALUES or {}),
                         'json_attributes_topic': base_topic,
                         'state_topic': base_topic,
                         'value_template': '{{ value_json.action }}',
@@ -285,19 +381,20 @@ class LumiMqtt:
                     retain=True,
                 ),
             ]
-            for event in button.PROVIDE_EVENTS:
+            for event in device.PROVIDE_EVENTS:
                 messages.append(
                     aio_mqtt.PublishableMessage(
                         topic_name=(
                             f'homeassistant/device_automation/'
-                            f'{button.name}_{self.dev_id}/action_{event}/config'
+                            f'{device.name}_{self.dev_id}/'
+                            f'action_{event}/config'
                         ),
-                        payload=json.dumps({
+                        payload=jsonlib.dumps({
                             # device_automation should not have
                             # name and unique_id
-                            'device': device,
+                            'device': self._ha_device,
                             'automation_type': 'trigger',
-                            'topic': f'{base_topic}/action',
+                            'topic': device.full_action_topic,
                             'subtype': event,
                             'payload': event,
                             'type': 'action',
@@ -306,81 +403,120 @@ class LumiMqtt:
                         retain=True,
                     ),
                 )
-            await aio.gather(*[self._client.publish(m) for m in messages])
+            return messages
 
         # set LED lights config
-        for light in self.lights:
-            await self._client.publish(
+        if isinstance(device, Light):
+            return [
                 aio_mqtt.PublishableMessage(
                     topic_name=f'homeassistant/light/{self.dev_id}/'
-                               f'{light.topic}/config',
-                    payload=json.dumps({
-                        **get_generic_vals(light.name),
+                               f'{device.topic}/config',
+                    payload=jsonlib.dumps({
+                        **self._get_generic_vals(device.name),
                         'schema': 'json',
-                        'supported_color_modes': [light.COLOR_MODE],
-                        'brightness': light.BRIGHTNESS,
-                        'state_topic': self._get_topic(light.topic),
-                        'command_topic': self._get_topic(light.topic_set),
+                        'supported_color_modes': [device.COLOR_MODE],
+                        'brightness': device.BRIGHTNESS,
+                        'state_topic': self._get_topic(device.topic),
+                        'command_topic': self._get_topic(device.topic_set),
                     }),
                     qos=aio_mqtt.QOSLevel.QOS_1,
                     retain=True,
                 ),
-            )
-        for command in self.custom_commands:
-            await self._client.publish(
+            ]
+
+        if isinstance(device, Command):
+            return [
                 aio_mqtt.PublishableMessage(
                     topic_name=f'homeassistant/switch/'
-                               f'{self.dev_id}_{command.name}/config',
-                    payload=json.dumps({
-                        **get_generic_vals(command.name),
-                        'state_topic': self._get_topic(command.topic),
-                        'command_topic': self._get_topic(command.topic_set),
+                               f'{self.dev_id}_{device.name}/config',
+                    payload=jsonlib.dumps({
+                        **self._get_generic_vals(device.name),
+                        'state_topic': self._get_topic(device.topic),
+                        'command_topic': self._get_topic(device.topic_set),
                     }),
                     qos=aio_mqtt.QOSLevel.QOS_1,
                     retain=True,
                 ),
+            ]
+        return []
+
+    def _should_send(self, sensor: Sensor, value, now: float) -> bool:
+        debounce_val = self._debounce_sensors.get(sensor)
+        if debounce_val is None:
+            self._record_sent(sensor, value, now)
+            return False
+        elapsed = now - debounce_val.last_sent
+        if elapsed >= self._sensor_debounce_period:
+            # max-wait keepalive: even an unchanged value is sent again, so
+            # staleness is bounded for subscribers without a retained value
+            should_send = True
+        elif sensor.BINARY:
+            should_send = value != debounce_val.value
+        else:
+            # leading edge: a change over the threshold is sent unless the
+            # last send was too recent
+            should_send = (
+                abs(value - debounce_val.value) >= self._sensor_threshold and
+                elapsed >= self._sensor_min_interval
+            )
+        if should_send:
+            self._record_sent(sensor, value, now)
+        return should_send
+
+    def _record_sent(self, sensor: Sensor, value, now: float):
+        debounce_val = self._debounce_sensors.get(sensor)
+        if debounce_val is None:
+            self._debounce_sensors[sensor] = DebounceSensor(
+                value=value,
+                last_sent=now,
             )
+        else:
+            # update in place, no allocation per sent value
+            debounce_val.value = value
+            debounce_val.last_sent = now
 
     async def _periodic_publish(self, period=1):
+        polled = [s for s in self.sensors if not s.edge_triggered]
+        watched = [s for s in self.sensors if s.edge_triggered]
+        if not self.sensors and not self.lights:
+            # returning would stop the service, so just idle until cancelled
+            await self._loop.create_future()
         while True:
-            if not self._client.is_connected():
-                await aio.sleep(1)
-                continue
+            await self._connected.wait()
+            # schedule from the tick start, so the period does not drift
+            deadline = self._loop.time() + period
             try:
-                for sensor in self.sensors:
-                    value = sensor.get_value()
+                messages = []
+                for sensor in polled:
+                    value = await run_io(sensor.get_value)
+                    if self._should_send(sensor, value, self._loop.time()):
+                        messages.append(self._sensor_message(sensor, value))
+                now = self._loop.time()
+                for sensor in watched:
+                    # edges are sent by _watch_sensors, only the keepalive
+                    # is due here; read the pin, an edge may have been
+                    # acknowledged by another read without being recorded
                     debounce_val = self._debounce_sensors.get(sensor)
-                    if self._is_binary(sensor):
-                        should_send = (
-                            debounce_val is None or value != debounce_val.value
-                        )
-                    else:
-                        should_send = (
-                            debounce_val is None or
-                            abs(value - debounce_val.value) >=
-                            self._sensor_threshold or
-                            (
-                                datetime.now() - debounce_val.last_sent
-                            ).seconds >= self._sensor_debounce_period
-                        )
-
-                    if should_send:
-                        self._debounce_sensors[sensor] = DebounceSensor(
-                            value=value,
-                            last_sent=datetime.now(),
-                        )
-                        await self._publish_sensor(sensor, value)
-
+                    if debounce_val is None or (
+                        now - debounce_val.last_sent <
+                        self._sensor_debounce_period
+                    ):
+                        continue
+                    value = await run_io(sensor.get_value)
+                    if self._should_send(sensor, value, self._loop.time()):
+                        messages.append(self._sensor_message(sensor, value))
+                if messages:
+                    await aio.gather(*[
+                        self._client.publish(m) for m in messages
+                    ])
+
+                now = self._loop.time()
                 for light in self.lights:
-                    now = datetime.now()
-                    should_send = (
-                        self._light_last_sent is None or
-                        (now - self._light_last_sent).seconds >=
-                        self._light_notification_period
-                    )
-                    if should_send:
+                    last_sent = self._light_last_sent.get(light)
+                    if last_sent is None or (
+                        now - last_sent >= self._light_notification_period
+                    ):
                         await self._publish_light(light)
-                        self._light_last_sent = datetime.now()
             except (
                 aio_mqtt.ConnectionClosedError,
                 aio_mqtt.ServerDiedError,
@@ -389,83 +525,162 @@ class LumiMqtt:
                 await self._client.wait_for_connect()
                 continue
 
-            await aio.sleep(period)
+            await aio.sleep(max(0.0, deadline - self._loop.time()))
+
+    async def _watch_sensors(self):
+        watched = {s.fileno(): s for s in self.sensors if s.edge_triggered}
+        if not watched:
+            # returning would stop the service, so just idle until cancelled
+            await self._loop.create_future()
+        # a gpio value file is always readable, an edge is only signalled
+        # as POLLPRI. Wait for it on a private epoll, its own descriptor
+        # becomes readable for the event loop when an edge happens.
+        epoll = select.epoll()
+        for fd, sensor in watched.items():
+            epoll.register(fd, select.EPOLLPRI)
+            value = await run_io(sensor.get_value)
+            self._should_send(sensor, value, self._loop.time())
+        changed: ty.Dict[Sensor, str] = {}
+        changed_event = aio.Event()
+
+        def on_edge():
+            for fd, _ in epoll.poll(0):
+                sensor = watched[fd]
+                try:
+                    # the read acknowledges the edge, keep the latest value
+                    changed[sensor] = sensor.get_value()
+                except OSError:
+                    # an unacknowledged edge would call this again and
+                    # again, stop watching the sensor instead
+                    logger.exception(f'Can not read {sensor.name} sensor')
+                    epoll.unregister(fd)
+            changed_event.set()
+
+        self._loop.add_reader(epoll.fileno(), on_edge)
+        try:
+            while True:
+                await changed_event.wait()
+                await self._connected.wait()
+                changed_event.clear()
+                now = self._loop.time()
+                messages = [
+                    self._sensor_message(sensor, value)
+                    for sensor, value in changed.items()
+                    if self._should_send(sensor, value, now)
+                ]
+                changed.clear()
+                try:
+                    await aio.gather(*[
+                        self._client.publish(m) for m in messages
+                    ])
+                except (
+                    aio_mqtt.ConnectionClosedError,
+                    aio_mqtt.ServerDiedError,
+                ) as e:
+                    logger.error("Connection closed", exc_info=e)
+                    await self._client.wait_for_connect()
+        finally:
+            self._loop.remove_reader(epoll.fileno())
+            epoll.close()
+
+    def _sensor_message(self, sensor: Sensor, value):
+        if sensor.BINARY:
+            # only ON/OFF, the messages are immutable and can be reused
+            message = self._binary_messages.get((sensor, value))
+            if message is None:
+                message = self._binary_messages[(sensor, value)] = \
+                    aio_mqtt.PublishableMessage(
+                        topic_name=sensor.full_topic,
+                        payload=value,
+                        qos=aio_mqtt.QOSLevel.QOS_1,
+                        retain=self._sensor_retain,
+                    )
+            return message
+        return aio_mqtt.PublishableMessage(
+            topic_name=sensor.full_topic,
+            payload=value,
+            qos=aio_mqtt.QOSLevel.QOS_1,
+            retain=self._sensor_retain,
+        )
 
     async def _publish_sensor(self, sensor: Sensor, value=None):
         if value is None:
-            value = sensor.get_value()
-        await self._client.publish(
-            aio_mqtt.PublishableMessage(
-                topic_name=self._get_topic(sensor.topic),
-                payload=value,
-                qos=aio_mqtt.QOSLevel.QOS_1,
-                retain=self._sensor_retain,
-            ),
-        )
+            value = await run_io(sensor.get_value)
+        # the debounce and the keepalive compare with what was sent last
+        self._record_sent(sensor, value, self._loop.time())
+        await self._client.publish(self._sensor_message(sensor, value))
 
     async def _publish_light(self, light: Light):
         await self._client.publish(
             aio_mqtt.PublishableMessage(
-                topic_name=self._get_topic(light.topic),
-                payload=json.dumps(light.state),
+                topic_name=light.full_topic,
+                payload=light.state_json,
                 qos=aio_mqtt.QOSLevel.QOS_1,
             ),
         )
+        self._light_last_sent[light] = self._loop.time()
 
     async def _handle_buttons(self):
-        tasks = [
-            aio.create_task(button.handle(self._handle_click))
-            for button in self.buttons
-        ]
-        try:
-            finished, unfinished = await aio.wait(
-                tasks,
-                return_when=aio.FIRST_COMPLETED,
-            )
-        except aio.CancelledError:
-            for t in tasks:
-                t.cancel()
-                try:
-                    await t
-                except aio.CancelledError:
-                    pass
-            raise
-
-        for t in unfinished:
-            t.cancel()
+        if not self.buttons:
+            # returning would stop the service, so just idle until cancelled
+            await self._loop.create_future()
+        # a failing button is restarted alone, the others keep working
+        await aio.gather(*[
+            self._supervise_button(button) for button in self.buttons
+        ])
+
+    async def _supervise_button(self, button: Button):
+        while True:
             try:
-                await t
+                await button.handle(self._handle_click)
             except aio.CancelledError:
-                pass
-        for t in finished:
-            t.result()
+                raise
+            except Exception:
+                logger.exception(
+                    "%s handler failed, restart in %d seconds",
+                    button.name,
+                    self._reconnection_interval,
+                )
+                await aio.sleep(self._reconnection_interval)
 
     async def _handle_click(self, button: Button, action: str):
         logger.debug(f'{button} sent "{action}" event')
+        # only the action state is worth an ack, the event topic and
+        # the reset are transient
         await aio.gather(
             self._client.publish(
                 aio_mqtt.PublishableMessage(
-                    topic_name=self._get_topic(button.topic),
-                    payload=json.dumps({'action': action}),
+                    topic_name=button.full_topic,
+                    payload=button.ACTION_PAYLOADS[action],
                     qos=aio_mqtt.QOSLevel.QOS_1,
                 ),
             ),
             self._client.publish(
                 aio_mqtt.PublishableMessage(
-                    topic_name=self._get_topic(f'{button.topic}/action'),
+                    topic_name=button.full_action_topic,
                     payload=action,
-                    qos=aio_mqtt.QOSLevel.QOS_1,
+                    qos=aio_mqtt.QOSLevel.QOS_0,
                 ),
             ),
         )
-        await self._client.publish(
-            aio_mqtt.PublishableMessage(
-                topic_name=self._get_topic(button.topic),
-                payload=json.dumps({'action': ''}),
-                qos=aio_mqtt.QOSLevel.QOS_1,
-            ),
+        # don't hold the next click until the reset is sent
+        self._run_background(
+            self._client.publish(self._button_reset_messages[button]),
         )
 
+    def _run_background(self, coro):
+        task = aio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: aio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                "Unhandled exception in background task",
+                exc_info=task.exception(),
+            )
+
     async def _connect_forever(self) -> None:
         while True:
             try:
@@ -492,30 +707,30 @@ class LumiMqtt:
                     f"'{client_id}'",
                 )
 
-                await self._client.publish(
-                    aio_mqtt.PublishableMessage(
-                        topic_name=self._topic_lwt,
-                        payload='online',
-                        qos=aio_mqtt.QOSLevel.QOS_1,
-                        retain=True,
-                    ),
-                )
+                await self._client.publish(self._online_message)
 
-                await self._client.subscribe(*[
-                    (t, aio_mqtt.QOSLevel.QOS_1)
-                    for t in self.subscribed_topics
-                ])
+                await self._client.subscribe(*self._subscriptions)
                 if self._auto_discovery:
                     await self.send_config()
 
-                for light in self.lights:
-                    await self._publish_light(light)
-
-                for sensor in self.sensors:
-                    await self._publish_sensor(sensor)
+                # don't wait for each PUBACK before sending the next state
+                await aio.gather(
+                    *[self._publish_light(light) for light in self.lights],
+                    *[self._publish_sensor(sensor) for sensor in self.sensors],
+                )
+                # spread the following light notifications over the period
+                now = self._loop.time()
+                for i, light in enumerate(self.lights):
+                    self._light_last_sent[light] = now - (
+                        i * self._light_notification_period / len(self.lights)
+                    )
 
+                self._connected.set()
                 logger.info("Wait for network interruptions...")
-                await connect_result.disconnect_reason
+                try:
+                    await connect_result.disconnect_reason
+                finally:
+                    self._connected.clear()
             except aio.CancelledError:
                 raise
 
@@ -547,7 +762,3 @@ class LumiMqtt:
             else:
                 logger.info("Disconnected")
                 return
-
-    @staticmethod
-    def _is_binary(sensor):
-        return isinstance(sensor, BinarySensor)
@@ -79,10 +79,16 @@ def lights() -> ty.List[Device]:
 def commands(params) -> ty.List[Device]:
     commands_: ty.List[Device] = []
     for topic, command in params.items():
+        if isinstance(command, dict):
+            command_options = dict(command)
+            command = command_options.pop('command')
+        else:
+            command_options = {}
         cmd_config = {
             'name': topic,
             'topic': topic,
             'device_file': command,
+            **command_options,
         }
         commands_.append(Command(**cmd_config))
     return commands_
@@ -4,6 +4,7 @@ LUMI sensor devices (GPIO, illuminance)
 
 import logging
 import os
+import typing as ty
 
 from .device import Device
 
@@ -14,6 +15,10 @@ class Sensor(Device):
     """
     Base sensor class
     """
+    BINARY = False
+    # value changes are signalled as POLLPRI on fileno(), no polling needed
+    edge_triggered = False
+
     def get_value(self):
         raise NotImplementedError()
 
@@ -22,25 +27,58 @@ class BinarySensor(Sensor):
     """
     Binary sensor (GPIO)
     """
+    BINARY = True
     MQTT_VALUES: dict = {}
 
     def __init__(self, name, gpio, topic, device_class=None):
         device_file = f"/sys/class/gpio/gpio{gpio}/value"
         super().__init__(name, device_file, topic)
         if device_class:
-            self.MQTT_VALUES['device_class'] = device_class
-        if not os.path.exists(device_file):
+            # per instance, the class dict is shared by all binary sensors
+            self.MQTT_VALUES = {
+                **self.MQTT_VALUES,
+                'device_class': device_class,
+            }
+        self._fd: ty.Optional[int] = None
+        # the pin is usually exported already, try it before a stat()
+        try:
+            self._fd = os.open(device_file, os.O_RDONLY)
+        except FileNotFoundError:
             try:
                 with open('/sys/class/gpio/export', 'w') as f:
                     f.write(str(gpio))
                 with open(f'/sys/class/gpio/gpio{gpio}/direction', 'w') as f:
                     f.write('in')
+                self._fd = os.open(device_file, os.O_RDONLY)
             except OSError as err:
                 logger.error(f"Can not setup {name} sensor: {err}")
+                return
+        except OSError as err:
+            logger.error(f"Can not open {name} sensor: {err}")
+            return
+        try:
+            with open(f'/sys/class/gpio/gpio{gpio}/edge', 'w') as f:
+                f.write('both')
+        except OSError:
+            # the pin has no interrupt, it will be polled
+            pass
+        else:
+            self.edge_triggered = True
+
+    def fileno(self):
+        return self._fd
 
     def get_value(self):
+        if self._fd is not None:
+            # the value file holds a single digit and a newline
+            return 'OFF' if os.pread(self._fd, 1, 0) == b'0' else 'ON'
         return 'OFF' if self.read_raw() == '0' else 'ON'
 
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
 
 class IlluminanceSensor(Sensor):
     """
@@ -52,6 +90,19 @@ class IlluminanceSensor(Sensor):
         'unit_of_measurement': 'lx',
     }
 
+    def __init__(self, name, device_file, topic=None):
+        super().__init__(name, device_file, topic)
+        # keep the sysfs attribute open, pread() from offset 0 re-reads it
+        self._fd: ty.Optional[int] = os.open(
+            self.device_file, os.O_RDONLY,
+        )
+
     def get_value(self):
-        raw_value = self.read_raw()
+        # a single pread() syscall, no lseek() + read() pair needed
+        raw_value = os.pread(self._fd, 32, 0)
         return int(int(raw_value) * self.COEFFICIENT)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -21,6 +21,10 @@ setup(
         'evdev>=1.0.0',
         'aio-mqtt-mod>=0.3.2',
     ],
+    extras_require={
+        'orjson': ['orjson'],
+        'uvloop': ['uvloop; sys_platform == "linux"'],
+    },
     packages=['lumimqtt'],
     entry_points={
         'console_scripts': ['lumimqtt=lumimqtt.__main__:main'],